@@ -0,0 +1,1278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Excel → Markdown 前処理ツール
+
+Excelワークブックを読み込み、AI(LLM)がMarkdown変換しやすい構造化データと
+ページ分割された可視化画像を生成する。
+
+主な機能:
+    - セルデータ・結合セル・テーブル構造の抽出
+    - 書式ヒント(太字・フォントサイズ等)の収集
+    - シートのページ単位可視化(PNG出力)
+    - AI処理用のJSON + プロンプトテンプレート出力
+"""
+
+import copy
+import io
+import os
+import sys
+import math
+import bisect
+import json
+import datetime
+from collections import deque
+from xml.etree.ElementTree import iterparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+import numpy as np
+import openpyxl
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.worksheet.cell_range import CellRange
+
+import matplotlib
+matplotlib.use('Agg')  # 描画はPNG出力のみ。GUIバックエンドの初期化を避ける
+import matplotlib.pyplot as plt
+import matplotlib.font_manager as fm
+from matplotlib.colors import to_rgba
+from matplotlib.patches import Rectangle
+from matplotlib.collections import LineCollection, PatchCollection
+
+try:
+    from numba import njit
+except ImportError:  # numbaは任意依存。無ければNumPy版のままでも十分速い
+    njit = None
+
+try:
+    import orjson
+except ImportError:  # orjsonも任意依存。無ければ標準のjsonで出力する
+    orjson = None
+
+
+def _assign_cells_to_pages(rows, cols, min_data_row, min_data_col,
+                           rows_per_page, cols_per_page, n_col_pages):
+    """各セルの所属ページIDを一括計算する(行ブロック×列ブロック)"""
+    page_r = (rows - min_data_row) // rows_per_page
+    page_c = (cols - min_data_col) // cols_per_page
+    return page_r * n_col_pages + page_c
+
+
+if njit is not None:
+    _assign_cells_to_pages = njit(cache=True)(_assign_cells_to_pages)
+
+
+_FONT_CACHE_PATH = os.path.join(
+    os.path.expanduser('~'), '.cache', 'excel_reader_font.json')
+
+
+def setup_japanese_font():
+    """日本語フォントを検出してmatplotlibに設定する
+
+    フォント解決はファイルシステム走査を伴い高価なため、一度解決した
+    フォント名は ~/.cache にキャッシュして次回以降のimportで再利用する。
+    """
+    plt.rcParams['axes.unicode_minus'] = False
+
+    # 前回解決したフォントがまだ有効ならそれを使う
+    try:
+        with open(_FONT_CACHE_PATH, encoding='utf-8') as f:
+            cached = json.load(f).get('font')
+        if cached and fm.FontProperties(family=cached).get_name() == cached:
+            plt.rcParams['font.family'] = cached
+            return cached
+    except (OSError, ValueError):
+        pass
+
+    # rcで既にフォントが明示設定されていれば検出処理自体をスキップする
+    configured = plt.rcParams['font.family']
+    if configured and configured != ['sans-serif']:
+        return configured[0] if isinstance(configured, list) else configured
+
+    candidates = [
+        'Yu Gothic', 'Meiryo', 'MS Gothic',
+        'Hiragino Sans', 'Hiragino Kaku Gothic ProN',
+        'Noto Sans CJK JP', 'IPAGothic', 'TakaoGothic',
+    ]
+    selected = None
+    for candidate in candidates:
+        # findfontで解決できるかの確認だけで十分。描画テストは
+        # matplotlibが描画時まで例外を出さないため意味を持たない
+        if fm.FontProperties(family=candidate).get_name() == candidate:
+            selected = candidate
+            break
+
+    if selected is None:
+        # Azure等のLinux環境ではNotoフォントをパス指定で追加する
+        noto_paths = [
+            '/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc',
+            '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+        ]
+        for path in noto_paths:
+            if os.path.exists(path):
+                fm.fontManager.addfont(path)
+                selected = fm.FontProperties(fname=path).get_name()
+                break
+
+    if selected:
+        plt.rcParams['font.family'] = selected
+        try:
+            os.makedirs(os.path.dirname(_FONT_CACHE_PATH), exist_ok=True)
+            with open(_FONT_CACHE_PATH, 'w', encoding='utf-8') as f:
+                json.dump({'font': selected}, f)
+        except OSError:
+            pass
+    return selected
+
+
+JAPANESE_FONT = setup_japanese_font()
+
+# 列番号→列記号の変換は純関数かつ高頻度なのでキャッシュする
+# (Excelの列は最大16384なのでキャッシュは飽和する)
+_col_letter = lru_cache(maxsize=16384)(get_column_letter)
+
+def _add_grid_lines(ax, num_rows, num_cols, cell_width, cell_height):
+    """セルグリッド線を1つのLineCollectionとしてまとめて追加する"""
+    grid_w = num_cols * cell_width
+    grid_h = num_rows * cell_height
+    lines = [[(0, i * cell_height), (grid_w, i * cell_height)]
+             for i in range(num_rows + 1)]
+    lines += [[(j * cell_width, 0), (j * cell_width, grid_h)]
+              for j in range(num_cols + 1)]
+    ax.add_collection(LineCollection(lines, colors='#D0D0D0', linewidths=0.8))
+
+
+def _json_default(obj):
+    """json.dump用: NumPy配列・スカラーを素のPython値に落とす"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
+# 文字列長 → フォントサイズの分岐なしルックアップ(10未満:9 / 20未満:8 / 以降:7)
+_FONTSIZE_LUT = bytes([9] * 10 + [8] * 10 + [7] * 200)
+_FONTSIZE_LUT_MAX = len(_FONTSIZE_LUT) - 1
+
+
+def _dumps_bytes(obj):
+    """JSONをUTF-8バイト列にエンコードする(orjsonがあれば使う)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY,
+                            default=_json_default)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'),
+                      default=_json_default).encode('utf-8')
+
+
+@lru_cache(maxsize=512)
+def _is_percent_format(number_format):
+    """表示形式がパーセント書式かどうか(書式文字列ごとにキャッシュ)"""
+    return '%' in number_format
+
+
+# 型名文字列は数種類しかないので、都度__name__を引かず共有インスタンスを返す
+_TYPE_NAMES = {
+    int: 'int',
+    float: 'float',
+    str: 'str',
+    bool: 'bool',
+    datetime.datetime: 'datetime',
+    datetime.date: 'date',
+    type(None): 'NoneType',
+}
+
+# セル値の整形はisinstanceの連鎖ではなく型ディスパッチで1回の辞書参照にする
+_FORMATTERS = {
+    bool: lambda value, number_format: 'Yes' if value else 'No',
+    int: lambda value, number_format: str(value),
+    float: lambda value, number_format: (
+        f"{value * 100:.1f}%"
+        if number_format and _is_percent_format(number_format)
+        else f"{value:.2f}"),
+    str: lambda value, number_format: value,
+    datetime.datetime: lambda value, number_format: value.strftime('%Y-%m-%d'),
+}
+
+# 領域の塗り色(テーブルは循環、結合セルは固定)
+_TABLE_COLORS = ['#FFE4E1', '#E0FFFF', '#F0FFF0', '#FFF8DC', '#F5F5DC']
+_TABLE_RGBA = [to_rgba(c, alpha=0.3) for c in _TABLE_COLORS]
+_MERGED_RGBA = to_rgba('#E6E6FA', alpha=0.4)
+
+
+def _rasterize_region_fills(num_rows, num_cols, min_row, min_col,
+                            tables, merged):
+    """テーブル・結合セルの塗りを1枚のRGBA配列に焼き込む
+
+    パッチを領域ごとに重ねる代わりに、imshowで一度に描ける画像を作る。
+    描画コストが領域数に依存しなくなる。
+    """
+    bg = np.zeros((num_rows, num_cols, 4), dtype=np.float32)
+    for idx, table in enumerate(tables):
+        bounds = table['bounds']
+        r0 = max(bounds['min_row'] - min_row, 0)
+        r1 = min(bounds['max_row'] - min_row, num_rows - 1)
+        c0 = max(bounds['min_col'] - min_col, 0)
+        c1 = min(bounds['max_col'] - min_col, num_cols - 1)
+        bg[r0:r1 + 1, c0:c1 + 1] = _TABLE_RGBA[idx % len(_TABLE_RGBA)]
+    for m in merged:
+        r0 = max(m['min_row'] - min_row, 0)
+        r1 = min(m['max_row'] - min_row, num_rows - 1)
+        c0 = max(m['min_col'] - min_col, 0)
+        c1 = min(m['max_col'] - min_col, num_cols - 1)
+        bg[r0:r1 + 1, c0:c1 + 1] = _MERGED_RGBA
+    return bg
+
+
+# 領域探索の近傍: 隣接8方向と、空白1セルを跨ぐ軸方向の2マスジャンプ
+_NEIGHBOR_OFFSETS = ((-1, 0), (1, 0), (0, -1), (0, 1),
+                     (-1, -1), (-1, 1), (1, -1), (1, 1))
+_GAP_OFFSETS = ((-2, 0), (2, 0), (0, -2), (0, 2))
+
+
+def _get_print_area(workbook, sheet):
+    """シートの印刷範囲定義を返す(未設定ならNone)
+
+    read_onlyモードのReadOnlyWorksheetにはprint_areaプロパティがなく、
+    属性アクセスはAttributeErrorになる。ワークブック読込時にパーサが
+    シートへ束ねる_print_area(シートスコープの_xlnm.Print_Area定義名)を
+    参照し、それも無ければワークブック側の定義名から引く。
+    """
+    area = getattr(sheet, 'print_area', None)
+    if not area:
+        area = getattr(sheet, '_print_area', None)
+    if not area:
+        # ワークブックレベルの定義名は別シート宛てのこともあるため、
+        # シート修飾子がこのシートを指す範囲だけを採用する
+        defn = workbook.defined_names.get('_xlnm.Print_Area')
+        if defn is not None:
+            for title, coord in defn.destinations:
+                if title == sheet.title:
+                    return coord
+    return area
+
+
+def _read_merged_ranges(sheet):
+    """シートの結合セル範囲(CellRange)の一覧を返す
+
+    read_onlyモードは結合セルのメタデータをパースしないため、
+    merged_cellsを持たないシートではアーカイブ内のシートXMLから
+    mergeCell要素だけを直接読み取る。
+    """
+    merged = getattr(sheet, 'merged_cells', None)
+    if merged is not None:
+        return merged.ranges
+    ranges = []
+    src = sheet._get_source()
+    try:
+        for _, element in iterparse(src):
+            if element.tag.endswith('}mergeCell'):
+                ranges.append(CellRange(element.attrib['ref']))
+            element.clear()
+    finally:
+        src.close()
+    return ranges
+
+
+# 変換プロンプトの定型部分。呼び出しごとに組み立て直さない
+_PROMPT_HEADER = """# Excel to Markdown Conversion Task
+
+## Source
+- File: {source_file}
+- Sheets: {sheet_count}
+
+## Conversion Instructions
+以下のシート構造情報とページ画像を参照し、元のレイアウト・意味構造を
+保ったMarkdownドキュメントを生成してください。
+
+## Sheet Overview
+"""
+
+_SHEET_TMPL = """
+### Sheet: {name}
+- Document Type: {document_type}
+- Tables: {table_count}
+- Sections: {section_count}
+- Suggested Approach: {suggested_structure}
+"""
+
+_PROMPT_FOOTER = """
+## Expected Output Format
+- シートごとに `## シート名` の見出しを付けること
+- テーブルはMarkdownテーブル記法で再現すること
+- 結合セルはテーブルの文脈に応じて適切に展開すること
+- 書式ヒント(太字・見出し候補)をMarkdown記法に反映すること
+"""
+
+@lru_cache(maxsize=64)
+def _build_markdown_hints(table_count, has_sections, table_ids,
+                          headers, alignments, has_bold, has_heading):
+    """構造指紋からMarkdown変換ヒントを組み立てる
+
+    月次レポートのように同型シートが並ぶワークブックでは指紋が一致する
+    ため、組み立ては最初の1回で済む。呼び出し側はコピーを返すこと。
+    """
+    hints = {
+        'suggested_structure': 'document',
+        'table_conversion': [],
+        'formatting_rules': [],
+    }
+    if has_sections:
+        hints['suggested_structure'] = 'sectioned_document'
+    elif table_count == 1:
+        hints['suggested_structure'] = 'single_table_document'
+
+    hints['table_conversion'] = [
+        {'table_id': table_id,
+         'format': 'markdown_table',
+         'alignment': alignment}
+        if has_header else
+        {'table_id': table_id,
+         'format': 'list' if alignment == 'vertical' else 'key_value'}
+        for table_id, has_header, alignment
+        in zip(table_ids, headers, alignments)
+    ]
+
+    if has_bold:
+        hints['formatting_rules'].append('太字セルは**強調**に変換する')
+    if has_heading:
+        hints['formatting_rules'].append('見出し候補セルは # 見出しに変換する')
+    return hints
+
+
+_GUIDE_TAIL = """
+```
+JSONデータ構造:
+  sheets[].structure.cells   … セル座標 → 値
+  sheets[].structure.tables  … 検出テーブル(範囲・ヘッダー有無)
+  sheets[].structure.merged  … 結合セル
+  sheets[].pages             … ページキーと画像パスの索引
+  (ページ本体は paged_data.json に1ページ1行のNDJSONで格納)
+```
+JSONデータと画像からMarkdownを生成してください。画像はレイアウト確認用、
+JSONは正確な値の参照用です。
+"""
+
+
+def _render_page(spec, fig=None):
+    """1ページ分のセルグリッドをPNGとして描画する
+
+    プロセスプールから呼べるようトップレベル関数にしてある。figを渡すと
+    そのFigureを再利用し(シリアル描画用)、渡さなければ自前で生成する。
+    """
+    (sheet_name, page_key, page_rows, page_cols, page_vals,
+     page_tables, page_merged, page_info, output_dir, dpi) = spec
+    page_min_row = page_info['page_min_row']
+    page_max_row = page_info['page_max_row']
+    page_min_col = page_info['page_min_col']
+    page_max_col = page_info['page_max_col']
+    num_rows = page_max_row - page_min_row + 1
+    num_cols = page_max_col - page_min_col + 1
+    cell_width = 1.2
+    cell_height = 0.4
+
+    fig_width = max(6.0, num_cols * cell_width + 1.5)
+    fig_height = max(4.0, num_rows * cell_height + 1.5)
+    # ラスタライズ時間はdpi^2に比例する。7〜9ptのテキストには横1600pxも
+    # あれば十分なので、それを超えるdpi指定は切り詰める
+    dpi = min(dpi, math.ceil(1600 / fig_width))
+    owns_fig = fig is None
+    if owns_fig:
+        fig = plt.figure(figsize=(fig_width, fig_height))
+    else:
+        fig.clf()
+        fig.set_size_inches(fig_width, fig_height)
+    ax = fig.add_subplot(111)
+    # グリッド線
+    _add_grid_lines(ax, num_rows, num_cols, cell_width, cell_height)
+
+    # 領域の塗りは1枚のRGBA画像に焼き込み、枠線だけをベクタで重ねる
+    if page_tables or page_merged:
+        bg = _rasterize_region_fills(num_rows, num_cols,
+                                     page_min_row, page_min_col,
+                                     page_tables, page_merged)
+        ax.imshow(bg, extent=(0, num_cols * cell_width,
+                              0, num_rows * cell_height),
+                  origin='upper', interpolation='nearest',
+                  aspect='auto', zorder=0)
+    region_rects = []
+    for table in page_tables:
+        bounds = table['bounds']
+        t_min_col = max(bounds['min_col'], page_min_col)
+        t_min_row = max(bounds['min_row'], page_min_row)
+        t_max_col = min(bounds['max_col'], page_max_col)
+        t_max_row = min(bounds['max_row'], page_max_row)
+        x = (t_min_col - page_min_col) * cell_width
+        y = (page_max_row - t_max_row) * cell_height
+        w = (t_max_col - t_min_col + 1) * cell_width
+        h = (t_max_row - t_min_row + 1) * cell_height
+        region_rects.append(Rectangle(
+            (x, y), w, h, facecolor='none',
+            alpha=0.3, edgecolor='red', linewidth=1.5))
+
+    # 結合セルの枠
+    for merged in page_merged:
+        m_min_col = max(merged['min_col'], page_min_col)
+        m_min_row = max(merged['min_row'], page_min_row)
+        m_max_col = min(merged['max_col'], page_max_col)
+        m_max_row = min(merged['max_row'], page_max_row)
+        x = (m_min_col - page_min_col) * cell_width
+        y = (page_max_row - m_max_row) * cell_height
+        w = (m_max_col - m_min_col + 1) * cell_width
+        h = (m_max_row - m_min_row + 1) * cell_height
+        region_rects.append(Rectangle(
+            (x, y), w, h, facecolor='none',
+            alpha=0.4, edgecolor='blue', linewidth=1.2))
+        if merged['value'] is not None:
+            ax.text(x + w / 2, y + h / 2, str(merged['value'])[:40],
+                    ha='center', va='center', fontsize=8,
+                    bbox=dict(boxstyle="round,pad=0.05",
+                              facecolor='white', alpha=0.6))
+    if region_rects:
+        ax.add_collection(PatchCollection(region_rects, match_original=True))
+
+    # セル値のテキスト(座標は抽出済みの数値配列をそのまま使う)。
+    # セル幅が約30px未満になる場合は判読不能なので描画自体を省く
+    if cell_width * dpi >= 30:
+        for row, col, value in zip(page_rows, page_cols, page_vals):
+            x = (col - page_min_col) * cell_width + cell_width / 2
+            y = (page_max_row - row) * cell_height + cell_height / 2
+            value_str = str(value)
+            if len(value_str) > 15:
+                value_str = value_str[:15] + '…'
+            fontsize = _FONTSIZE_LUT[min(len(value_str), _FONTSIZE_LUT_MAX)]
+            # グリッド線がセルを区切っているので白背景ボックスは不要。
+            # bboxはテキストごとにFancyBboxPatchを生むため、セル数分は高くつく
+            ax.text(x, y, value_str, ha='center', va='center',
+                    fontsize=fontsize)
+
+    # 軸ラベル(Excel風の列記号・行番号)。列記号はシート単位で生成済み。
+    # 目盛りは1本ごとにTextアーティストを生むため、40本を超えたら間引く
+    col_labels = page_info['col_labels']
+    row_labels = list(range(page_max_row, page_min_row - 1, -1))
+    col_step = math.ceil(num_cols / 40)
+    row_step = math.ceil(num_rows / 40)
+    ax.set_xticks([(i + 0.5) * cell_width
+                   for i in range(0, num_cols, col_step)])
+    ax.set_xticklabels(col_labels[::col_step], fontsize=8)
+    ax.set_yticks([(i + 0.5) * cell_height
+                   for i in range(0, num_rows, row_step)])
+    ax.set_yticklabels(row_labels[::row_step], fontsize=8)
+    ax.set_xlim(0, num_cols * cell_width)
+    ax.set_ylim(0, num_rows * cell_height)
+    ax.set_title(f"{sheet_name} - {page_key} "
+                 f"({_col_letter(page_min_col)}{page_min_row}:"
+                 f"{_col_letter(page_max_col)}{page_max_row})",
+                 fontsize=11)
+
+    page_file = os.path.join(
+        output_dir, f"{sheet_name}_{page_key}.png")
+    # tight_layoutはレンダラを複数回走らせるソルバで高くつく。figsizeは
+    # 内容から算出済みなので固定マージンで十分
+    fig.subplots_adjust(left=0.06, right=0.98, top=0.94, bottom=0.08)
+    # pyplotの状態機械を経由せずFigureから直接保存する
+    # figsizeは内容から算出済みなのでtight bbox(全アーティスト走査)は不要。
+    # AI入力用の使い捨てPNGなので圧縮レベルも最低限でよい
+    fig.savefig(page_file, dpi=dpi, facecolor='white',
+                pil_kwargs={'compress_level': 1})
+    if owns_fig:
+        plt.close(fig)
+    return page_file
+
+
+class ExcelToMarkdownPreprocessor:
+    """ExcelファイルをAI変換用の中間表現に前処理するクラス"""
+
+    def __init__(self, file_path, load_formatting=False):
+        self.file_path = file_path
+        # スタイルの遅延デシリアライズはopenpyxlで特に高価なため、
+        # 書式ヒントが不要な呼び出し元ではスキップできるようにする
+        self.load_formatting = load_formatting
+        # ページ描画で再利用するFigure(ページごとの生成・破棄を避ける)
+        self._cached_fig = None
+        # read_onlyで一度だけロードする。数式側のワークブックは参照されないため
+        # ロードしない(巨大ファイルでのXMLパース二重コストを避ける)
+        self.workbook = openpyxl.load_workbook(
+            file_path, data_only=True, read_only=True, keep_links=False)
+        self.sheet_names = self.workbook.sheetnames
+        # 抽出は遅延実行。触れられたシートだけをget_sheet_data経由で処理する
+        self.ai_optimized_data = {}
+
+    def close(self):
+        """ワークブックと再利用中のFigureを解放する"""
+        if self._cached_fig is not None:
+            plt.close(self._cached_fig)
+            self._cached_fig = None
+        self.workbook.close()
+
+    def get_sheet_data(self, sheet_name):
+        """シートの抽出結果を返す(未抽出なら抽出してキャッシュする)"""
+        if sheet_name not in self.ai_optimized_data:
+            self.ai_optimized_data[sheet_name] = self.extract_structured_data(sheet_name)
+        return self.ai_optimized_data[sheet_name]
+
+    def preload_all_sheets(self):
+        """全シートをまとめて抽出する(全シートを使う処理向けの一括パス)"""
+        pending = [name for name in self.sheet_names
+                   if name not in self.ai_optimized_data]
+        if len(pending) > 1:
+            # シート同士は独立なのでスレッドで並列抽出する。同一ワークブックの
+            # 共有はスレッドセーフでないため、ワーカーごとにread_onlyで開き直す
+            # (read_onlyのロードは軽量)
+            workers = min(8, len(pending))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(self._extract_sheet_threadsafe, pending)
+            self.ai_optimized_data.update(zip(pending, results))
+        elif pending:
+            self.ai_optimized_data[pending[0]] = self.extract_structured_data(pending[0])
+
+    def _extract_sheet_threadsafe(self, sheet_name):
+        """ワーカースレッド用: 専用ワークブックを開いて1シート抽出する"""
+        workbook = openpyxl.load_workbook(
+            self.file_path, data_only=True, read_only=True, keep_links=False)
+        try:
+            return self.extract_structured_data(sheet_name, workbook)
+        finally:
+            workbook.close()
+
+    def extract_structured_data(self, sheet_name, workbook=None):
+        """シートからセル・結合・テーブル・書式情報を抽出する"""
+        workbook = workbook or self.workbook
+        sheet = workbook[sheet_name]
+        sheet_data = {
+            'sheet_name': sheet_name,
+            'cells': {},
+            'merged': [],
+            'tables': [],
+            'formatting_hints': [],
+            'semantic_structure': {},
+            'data_bounds': {},
+        }
+
+        # 印刷範囲が設定されていればその範囲だけを対象にする
+        # (パースはopenpyxl付属のrange_boundariesに任せる)
+        print_area_bounds = None
+        print_area = _get_print_area(workbook, sheet)
+        if print_area:
+            area = str(print_area)
+            if '!' in area:
+                area = area.split('!')[-1]
+            try:
+                min_col, min_row, max_col, max_row = range_boundaries(area)
+            except ValueError:
+                pass
+            else:
+                print_area_bounds = {
+                    'min_col': min_col,
+                    'min_row': min_row,
+                    'max_col': max_col,
+                    'max_row': max_row,
+                }
+
+        # 一回の走査でセル値と(row, col)グリッドを構築する
+        # 併せてSoA形式(行・列・値の並列配列)も蓄積し、後段のページ分割を
+        # ベクトル化できるようにする
+        (sheet_data['cells'], cells_by_rc, rows_l, cols_l, vals_l,
+         formatting_hints, number_formats) = self._scan_sheet(
+            sheet, print_area_bounds)
+
+        rows_arr = np.asarray(rows_l, dtype=np.int32)
+        cols_arr = np.asarray(cols_l, dtype=np.int32)
+        sheet_data['rows'] = rows_arr
+        sheet_data['cols'] = cols_arr
+        sheet_data['values'] = np.array(vals_l, dtype=object)
+
+        if rows_arr.size:
+            # データ範囲はループ内の逐次min/maxではなく配列リダクションで求める
+            min_row = int(rows_arr.min())
+            max_row = int(rows_arr.max())
+            min_col = int(cols_arr.min())
+            max_col = int(cols_arr.max())
+            sheet_data['data_bounds'] = {
+                'min_row': min_row,
+                'max_row': max_row,
+                'min_col': min_col,
+                'max_col': max_col,
+                'range': f"{_col_letter(min_col)}{min_row}:"
+                         f"{_col_letter(max_col)}{max_row}",
+            }
+
+        # 結合セル情報。CellRangeが持つ整数境界をそのまま保持し、
+        # 後段で範囲文字列を再パースしなくて済むようにする
+        for merged_range in _read_merged_ranges(sheet):
+            top_left = f"{_col_letter(merged_range.min_col)}{merged_range.min_row}"
+            sheet_data['merged'].append({
+                'range': str(merged_range),
+                'min_row': merged_range.min_row,
+                'max_row': merged_range.max_row,
+                'min_col': merged_range.min_col,
+                'max_col': merged_range.max_col,
+                'value': sheet_data['cells'].get(top_left),
+            })
+
+        sheet_data['formatting_hints'] = formatting_hints
+        sheet_data['tables'] = self.detect_table_structure(
+            cells_by_rc, number_formats)
+
+        # 描画パスがページ・呼び出しごとに再計算しない、シート単位の補助構造。
+        # JSON出力には含めない(エクスポート側で除外する)
+        tables_sorted = sorted(sheet_data['tables'],
+                               key=lambda t: t['bounds']['min_row'])
+        merged_sorted = sorted(sheet_data['merged'],
+                               key=lambda m: m['min_row'])
+        sheet_data['_internal'] = {
+            'tables_by_min_row': tables_sorted,
+            'table_min_rows': [t['bounds']['min_row'] for t in tables_sorted],
+            'merged_by_min_row': merged_sorted,
+            'merged_min_rows': [m['min_row'] for m in merged_sorted],
+            # 列ラベルはシートで1回だけ生成し、描画側でスライスして使う
+            'col_labels_all': [
+                _col_letter(i)
+                for i in range(1, (sheet_data['data_bounds']['max_col'] + 1
+                                   if rows_arr.size else 1))],
+        }
+        sheet_data['semantic_structure'] = self._analyze_semantic_structure(sheet_data)
+        return sheet_data
+
+    def detect_table_structure(self, cells_by_rc, number_formats=None):
+        """連続したデータ領域をテーブルとして検出する"""
+        tables = []
+        visited = set()
+        for (row, col) in sorted(cells_by_rc):
+            if (row, col) in visited:
+                continue
+            region = self._find_continuous_region(cells_by_rc, row, col, visited)
+            if not region:
+                continue
+            rows = [r for r, _ in region]
+            cols = [c for _, c in region]
+            t_min_row, t_max_row = min(rows), max(rows)
+            t_min_col, t_max_col = min(cols), max(cols)
+            # 2x2未満の領域はテーブルとみなさない
+            if t_max_row - t_min_row < 1 or t_max_col - t_min_col < 1:
+                continue
+            header_row = self._detect_header_row(
+                cells_by_rc, t_min_row, t_min_col, t_max_col)
+            table = {
+                'table_id': len(tables) + 1,
+                'range': f"{_col_letter(t_min_col)}{t_min_row}:"
+                         f"{_col_letter(t_max_col)}{t_max_row}",
+                'bounds': {
+                    'min_row': t_min_row,
+                    'max_row': t_max_row,
+                    'min_col': t_min_col,
+                    'max_col': t_max_col,
+                },
+                'has_header': header_row is not None,
+                'header_row': header_row,
+                'alignment': ('horizontal'
+                              if (t_max_col - t_min_col) >= (t_max_row - t_min_row)
+                              else 'vertical'),
+            }
+            table.update(self._extract_table_data(
+                cells_by_rc, t_min_row, t_max_row, t_min_col, t_max_col,
+                number_formats))
+            tables.append(table)
+        return tables
+
+    def _find_continuous_region(self, cells_by_rc, start_row, start_col, visited):
+        """BFSで連続データ領域を探索する(空白1セルまでは許容)"""
+        queue = deque([(start_row, start_col)])
+        region = []
+        region_visited = {(start_row, start_col)}
+        while queue:
+            r, c = queue.popleft()
+            if (r, c) not in cells_by_rc:
+                continue
+            region.append((r, c))
+            visited.add((r, c))
+            for dr, dc in _NEIGHBOR_OFFSETS:
+                nr, nc = r + dr, c + dc
+                if (nr, nc) in cells_by_rc and (nr, nc) not in region_visited:
+                    region_visited.add((nr, nc))
+                    queue.append((nr, nc))
+            # 空白1セルまでは許容: 中間セルが空の場合のみ2マス先へ跨ぐ
+            for dr, dc in _GAP_OFFSETS:
+                nr, nc = r + dr, c + dc
+                if (r + dr // 2, c + dc // 2) in cells_by_rc:
+                    continue
+                if (nr, nc) in cells_by_rc and (nr, nc) not in region_visited:
+                    region_visited.add((nr, nc))
+                    queue.append((nr, nc))
+        return region
+
+    def _detect_header_row(self, cells_by_rc, row, min_col, max_col):
+        """先頭行がヘッダーらしいかを判定する(全て文字列ならヘッダー)"""
+        values = []
+        for col in range(min_col, max_col + 1):
+            value = cells_by_rc.get((row, col))
+            if value is not None:
+                values.append(value)
+        if not values:
+            return None
+        if all(isinstance(v, str) for v in values):
+            return row
+        return None
+
+    def _extract_table_data(self, cells_by_rc, min_row, max_row, min_col, max_col,
+                            number_formats=None):
+        """テーブル範囲のセルデータをSoA(列指向)形式で抽出する
+
+        セルごとの6キー辞書はアロケーション負荷が大きいため、並列配列で
+        保持する。旧来の辞書リストが必要な場合は配列から都度組み立てる。
+        """
+        rows_l = []
+        cols_l = []
+        vals_l = []
+        formatted_l = []
+        types_l = []
+        if number_formats is None:
+            number_formats = {}
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                value = cells_by_rc.get((row, col))
+                if value is None:
+                    continue
+                rows_l.append(row)
+                cols_l.append(col)
+                vals_l.append(value)
+                value_type = type(value)
+                types_l.append(_TYPE_NAMES.get(value_type)
+                               or sys.intern(value_type.__name__))
+                formatted_l.append(self._format_value(
+                    value, number_formats.get((row, col))))
+
+        types_arr = np.array(types_l, dtype=object)
+        if types_l:
+            unique_types, counts = np.unique(types_arr, return_counts=True)
+            data_types = {str(t): int(n)
+                          for t, n in zip(unique_types, counts)}
+        else:
+            data_types = {}
+        return {
+            'data': {
+                'rows': np.asarray(rows_l, dtype=np.int32),
+                'cols': np.asarray(cols_l, dtype=np.int32),
+                'values': np.array(vals_l, dtype=object),
+                'formatted': np.array(formatted_l, dtype=object),
+                'types': types_arr,
+            },
+            'data_types': data_types,
+        }
+
+    def _format_value(self, value, number_format=None):
+        """セル値をMarkdown向けの表示文字列に整形する"""
+        formatter = _FORMATTERS.get(type(value))
+        return formatter(value, number_format) if formatter else str(value)
+
+    def _scan_sheet(self, sheet, print_area_bounds=None):
+        """1回の走査でセル値・グリッド・SoA配列・書式情報をまとめて構築する
+
+        書式が不要ならvalues_onlyの値タプルだけを読み、必要なら
+        スタイル付きCellの1パスで値と書式ヒントを同時に収集する。
+        いずれの場合もシートのXMLを読むのはこの1回だけ。
+        """
+        cells = {}
+        cells_by_rc = {}
+        rows_l = []
+        cols_l = []
+        vals_l = []
+        hints = []
+        number_formats = {}
+
+        bounds_kwargs = {}
+        if print_area_bounds is not None:
+            # 印刷範囲が小さい場合、範囲外の行をパースせずに済む
+            bounds_kwargs = {
+                'min_row': print_area_bounds['min_row'],
+                'max_row': print_area_bounds['max_row'],
+                'min_col': print_area_bounds['min_col'],
+                'max_col': print_area_bounds['max_col'],
+            }
+
+        if self.load_formatting:
+            for row in sheet.iter_rows(**bounds_kwargs):
+                for cell in row:
+                    value = cell.value
+                    if value is None:
+                        continue
+                    r, c = cell.row, cell.column
+                    cells[f"{_col_letter(c)}{r}"] = value
+                    cells_by_rc[(r, c)] = value
+                    rows_l.append(r)
+                    cols_l.append(c)
+                    vals_l.append(value)
+                    number_format = cell.number_format
+                    if number_format and number_format != 'General':
+                        number_formats[(r, c)] = number_format
+                    font = cell.font
+                    bold = bool(font.bold)
+                    # 太字でもサイズ指定もないセルはスタイル解決を打ち切る
+                    if not bold and (font.size is None or font.size < 12.0):
+                        continue
+                    size = float(font.size) if font.size else 11.0
+                    hints.append({
+                        'coordinate': cell.coordinate,
+                        'bold': bold,
+                        'font_size': size,
+                        'possible_heading': bold and size >= 12.0,
+                    })
+        else:
+            # values_only=TrueでCellオブジェクトの生成を省き、素の値タプルを
+            # 受け取る(座標はenumerateの開始オフセットから算出する)
+            start_row = bounds_kwargs.get('min_row', 1)
+            start_col = bounds_kwargs.get('min_col', 1)
+            value_rows = sheet.iter_rows(values_only=True, **bounds_kwargs)
+            for r, row in enumerate(value_rows, start=start_row):
+                for c, value in enumerate(row, start=start_col):
+                    if value is None:
+                        continue
+                    cells[f"{_col_letter(c)}{r}"] = value
+                    cells_by_rc[(r, c)] = value
+                    rows_l.append(r)
+                    cols_l.append(c)
+                    vals_l.append(value)
+
+        return cells, cells_by_rc, rows_l, cols_l, vals_l, hints, number_formats
+
+    def _analyze_semantic_structure(self, sheet_data):
+        """抽出結果からドキュメント構造を推定する"""
+        structure = {'document_type': 'unknown', 'sections': []}
+        tables = sheet_data['tables']
+        hints = sheet_data['formatting_hints']
+        if len(tables) >= 2:
+            structure['document_type'] = 'multi_table_report'
+        elif len(tables) == 1:
+            structure['document_type'] = 'single_table'
+        elif sheet_data['cells']:
+            structure['document_type'] = 'free_form'
+        for hint in hints:
+            if hint['possible_heading']:
+                value = sheet_data['cells'].get(hint['coordinate'])
+                if isinstance(value, str):
+                    structure['sections'].append({
+                        'title': value,
+                        'coordinate': hint['coordinate'],
+                    })
+        return structure
+
+    def create_paged_visualizations_with_data(self, sheet_name, output_dir,
+                                              rows_per_page=30, cols_per_page=10,
+                                              dpi=90, parallel=False):
+        """シートをページ単位に分割して可視化し、ページごとのデータを返す
+
+        parallel=Trueかつ複数ページなら、ページPNGの描画を
+        ProcessPoolExecutorに分配する(各ページは独立したファイル出力)。
+        """
+        sheet_data = self.get_sheet_data(sheet_name)
+        pages_data = {}
+        if not sheet_data['cells']:
+            return pages_data
+
+        # データ範囲は抽出時に計算済み
+        cell_rows = sheet_data['rows']
+        cell_cols = sheet_data['cols']
+        cell_values = sheet_data['values']
+        data_bounds = sheet_data['data_bounds']
+        min_data_row = data_bounds['min_row']
+        max_data_row = data_bounds['max_row']
+        min_data_col = data_bounds['min_col']
+        max_data_col = data_bounds['max_col']
+
+        # ページIDを一括計算し、argsortで1回だけグループ化する
+        # (ページごとの全セル走査 O(P*N) を O(N log N) に置き換える)
+        n_row_pages = (max_data_row - min_data_row) // rows_per_page + 1
+        n_col_pages = (max_data_col - min_data_col) // cols_per_page + 1
+        page_ids = _assign_cells_to_pages(
+            cell_rows, cell_cols, min_data_row, min_data_col,
+            rows_per_page, cols_per_page, n_col_pages)
+        order = np.argsort(page_ids, kind='stable')
+        sorted_ids = page_ids[order]
+
+        # テーブル・結合セルは抽出時にmin_rowでソート済み。各ページでは
+        # 行バンドに掛かり得る先頭区間だけを二分探索で切り出して調べる
+        internal = sheet_data['_internal']
+        tables_sorted = internal['tables_by_min_row']
+        table_min_rows = internal['table_min_rows']
+        merged_sorted = internal['merged_by_min_row']
+        merged_min_rows = internal['merged_min_rows']
+        col_labels_all = internal['col_labels_all']
+
+        render_specs = []
+        page_num = 0
+        for page_r in range(n_row_pages):
+            page_min_row = min_data_row + page_r * rows_per_page
+            page_max_row = min(page_min_row + rows_per_page - 1, max_data_row)
+            for page_c in range(n_col_pages):
+                page_min_col = min_data_col + page_c * cols_per_page
+                page_max_col = min(page_min_col + cols_per_page - 1, max_data_col)
+                page_num += 1
+                page_key = f"page_{page_num}"
+
+                # このページに属するセルのインデックス区間を切り出す
+                page_id = page_r * n_col_pages + page_c
+                lo = np.searchsorted(sorted_ids, page_id, side='left')
+                hi = np.searchsorted(sorted_ids, page_id, side='right')
+                idx = order[lo:hi]
+                page_rows = cell_rows[idx].tolist()
+                page_cols = cell_cols[idx].tolist()
+                page_vals = cell_values[idx].tolist()
+                page_cells = {
+                    f"{_col_letter(c)}{r}": v
+                    for r, c, v in zip(page_rows, page_cols, page_vals)
+                }
+
+                # ページと交差するテーブル(行バンド候補のみ整数境界で判定)
+                band_end = bisect.bisect_right(table_min_rows, page_max_row)
+                page_tables = [
+                    t for t in tables_sorted[:band_end]
+                    if (t['bounds']['max_row'] >= page_min_row
+                        and t['bounds']['min_col'] <= page_max_col
+                        and t['bounds']['max_col'] >= page_min_col)
+                ]
+
+                # ページと交差する結合セル
+                band_end = bisect.bisect_right(merged_min_rows, page_max_row)
+                page_merged = [
+                    m for m in merged_sorted[:band_end]
+                    if (m['max_row'] >= page_min_row
+                        and m['min_col'] <= page_max_col
+                        and m['max_col'] >= page_min_col)
+                ]
+
+                page_info = {
+                    'page_min_row': page_min_row,
+                    'page_max_row': page_max_row,
+                    'page_min_col': page_min_col,
+                    'page_max_col': page_max_col,
+                    'col_labels': col_labels_all[page_min_col - 1:
+                                                 page_max_col],
+                }
+                render_specs.append(
+                    (sheet_name, page_key, page_rows, page_cols, page_vals,
+                     page_tables, page_merged, page_info, output_dir, dpi))
+                pages_data[page_key] = {
+                    'range': f"{_col_letter(page_min_col)}{page_min_row}:"
+                             f"{_col_letter(page_max_col)}{page_max_row}",
+                    'cells': page_cells,
+                    'tables': page_tables,
+                    'merged': page_merged,
+                    'image': None,
+                }
+
+        # 描画フェーズ。ページ同士は独立なのでプロセスプールに分配できる
+        if parallel and len(render_specs) > 1:
+            with ProcessPoolExecutor() as executor:
+                image_paths = list(executor.map(_render_page, render_specs))
+        else:
+            if self._cached_fig is None:
+                self._cached_fig = plt.figure()
+            image_paths = [_render_page(spec, fig=self._cached_fig)
+                           for spec in render_specs]
+        for spec, image_path in zip(render_specs, image_paths):
+            pages_data[spec[1]]['image'] = image_path
+        return pages_data
+
+
+    def create_enhanced_visualization(self, sheet_name, output_path=None,
+                                      show_plot=False, dpi=150):
+        """シート全体を1枚の画像として可視化する"""
+        sheet_data = self.get_sheet_data(sheet_name)
+        if not sheet_data['cells']:
+            return None
+
+        # 座標は抽出時に数値化済み。文字列の再パースはしない
+        cell_rows = sheet_data['rows']
+        cell_cols = sheet_data['cols']
+        cell_values = sheet_data['values']
+        data_bounds = sheet_data['data_bounds']
+        min_data_row = data_bounds['min_row']
+        max_data_row = data_bounds['max_row']
+        min_data_col = data_bounds['min_col']
+        max_data_col = data_bounds['max_col']
+
+        num_rows = max_data_row - min_data_row + 1
+        num_cols = max_data_col - min_data_col + 1
+        cell_width = 1.2
+        cell_height = 0.4
+        fig_width = max(8.0, num_cols * cell_width + 1.5)
+        fig_height = max(6.0, num_rows * cell_height + 1.5)
+        # ページ描画と同じく、横1600pxを超えない範囲にdpiを抑える
+        dpi = min(dpi, math.ceil(1600 / fig_width))
+        if show_plot:
+            # 対話表示する場合のみ専用Figureを作る
+            fig, ax = plt.subplots(figsize=(fig_width, fig_height))
+        else:
+            if self._cached_fig is None:
+                self._cached_fig = plt.figure(figsize=(fig_width, fig_height))
+            fig = self._cached_fig
+            fig.clf()
+            fig.set_size_inches(fig_width, fig_height)
+            ax = fig.add_subplot(111)
+
+        _add_grid_lines(ax, num_rows, num_cols, cell_width, cell_height)
+
+        # 領域の塗りは1枚のRGBA画像に焼き込み、枠線だけをベクタで重ねる
+        if sheet_data['tables'] or sheet_data['merged']:
+            bg = _rasterize_region_fills(num_rows, num_cols,
+                                         min_data_row, min_data_col,
+                                         sheet_data['tables'],
+                                         sheet_data['merged'])
+            ax.imshow(bg, extent=(0, num_cols * cell_width,
+                                  0, num_rows * cell_height),
+                      origin='upper', interpolation='nearest',
+                      aspect='auto', zorder=0)
+        # 範囲はページ描画と同様にデータ範囲へクランプする。結合セルの
+        # 非アンカーセルはNoneのため、結合範囲の下端・右端がデータ範囲の
+        # 外に出ることは普通に起こり、そのままでは軸の外に描かれてしまう
+        region_rects = []
+        for table in sheet_data['tables']:
+            bounds = table['bounds']
+            t_min_col = max(bounds['min_col'], min_data_col)
+            t_min_row = max(bounds['min_row'], min_data_row)
+            t_max_col = min(bounds['max_col'], max_data_col)
+            t_max_row = min(bounds['max_row'], max_data_row)
+            x = (t_min_col - min_data_col) * cell_width
+            y = (max_data_row - t_max_row) * cell_height
+            w = (t_max_col - t_min_col + 1) * cell_width
+            h = (t_max_row - t_min_row + 1) * cell_height
+            region_rects.append(Rectangle(
+                (x, y), w, h, facecolor='none',
+                alpha=0.3, edgecolor='red', linewidth=1.5))
+
+        for merged in sheet_data['merged']:
+            m_min_col = max(merged['min_col'], min_data_col)
+            m_min_row = max(merged['min_row'], min_data_row)
+            m_max_col = min(merged['max_col'], max_data_col)
+            m_max_row = min(merged['max_row'], max_data_row)
+            x = (m_min_col - min_data_col) * cell_width
+            y = (max_data_row - m_max_row) * cell_height
+            w = (m_max_col - m_min_col + 1) * cell_width
+            h = (m_max_row - m_min_row + 1) * cell_height
+            region_rects.append(Rectangle(
+                (x, y), w, h, facecolor='none',
+                alpha=0.4, edgecolor='blue', linewidth=1.2))
+            if merged['value'] is not None:
+                ax.text(x + w / 2, y + h / 2, str(merged['value'])[:40],
+                        ha='center', va='center', fontsize=8,
+                        bbox=dict(boxstyle="round,pad=0.05",
+                                  facecolor='white', alpha=0.6))
+        if region_rects:
+            ax.add_collection(PatchCollection(region_rects, match_original=True))
+
+        # セル幅が約30px未満になる全体ビューではテキストは潰れるので省く
+        if cell_width * dpi >= 30:
+            for row, col, value in zip(cell_rows.tolist(), cell_cols.tolist(),
+                                       cell_values.tolist()):
+                x = (col - min_data_col) * cell_width + cell_width / 2
+                y = (max_data_row - row) * cell_height + cell_height / 2
+                value_str = str(value)
+                if len(value_str) > 15:
+                    value_str = value_str[:15] + '…'
+                fontsize = _FONTSIZE_LUT[min(len(value_str),
+                                             _FONTSIZE_LUT_MAX)]
+                ax.text(x, y, value_str, ha='center', va='center',
+                        fontsize=fontsize)
+
+        col_labels = sheet_data['_internal']['col_labels_all'][
+            min_data_col - 1:max_data_col]
+        row_labels = list(range(max_data_row, min_data_row - 1, -1))
+        col_step = math.ceil(num_cols / 40)
+        row_step = math.ceil(num_rows / 40)
+        ax.set_xticks([(i + 0.5) * cell_width
+                       for i in range(0, num_cols, col_step)])
+        ax.set_xticklabels(col_labels[::col_step], fontsize=8)
+        ax.set_yticks([(i + 0.5) * cell_height
+                       for i in range(0, num_rows, row_step)])
+        ax.set_yticklabels(row_labels[::row_step], fontsize=8)
+        ax.set_xlim(0, num_cols * cell_width)
+        ax.set_ylim(0, num_rows * cell_height)
+        ax.set_title(f"{sheet_name} 全体ビュー", fontsize=12)
+
+        fig.subplots_adjust(left=0.06, right=0.98, top=0.94, bottom=0.08)
+        if output_path:
+            fig.savefig(output_path, dpi=dpi, facecolor='white',
+                        pil_kwargs={'compress_level': 1})
+        if show_plot:
+            plt.show()
+        # 再利用するFigureはここではcloseしない(close()で一括解放)
+        return output_path
+
+    def export_for_ai_processing(self, output_dir='ai_input',
+                                 rows_per_page=30, cols_per_page=10):
+        """AI処理用のJSON・画像・プロンプト一式を出力する"""
+        os.makedirs(output_dir, exist_ok=True)
+        export_data = {
+            'source_file': os.path.basename(self.file_path),
+            'sheet_count': len(self.sheet_names),
+            'sheets': [],
+        }
+        self.preload_all_sheets()
+        json_path = os.path.join(output_dir, 'paged_data.json')
+        with open(json_path, 'wb') as pf:
+            for sheet_name in self.sheet_names:
+                sheet_data = self.get_sheet_data(sheet_name)
+                pages_data = self.create_paged_visualizations_with_data(
+                    sheet_name, output_dir,
+                    rows_per_page=rows_per_page, cols_per_page=cols_per_page,
+                    parallel=True)
+                # ページ本体は1ページ1行のNDJSONとして逐次書き出し、
+                # 全ページ分をメモリに保持しない
+                for page_key, page in pages_data.items():
+                    pf.write(_dumps_bytes({'sheet': sheet_name,
+                                           'page': page_key,
+                                           'data': page}))
+                    pf.write(b'\n')
+                sheet_info = {
+                    'name': sheet_name,
+                    # 内部用の補助構造はJSONに出さない
+                    'structure': {k: v for k, v in sheet_data.items()
+                                  if k != '_internal'},
+                    # ページの中身はNDJSON側。ここはキーと画像パスの索引のみ
+                    'pages': [[page_key, page['image']]
+                              for page_key, page in pages_data.items()],
+                    'markdown_hints': self._generate_markdown_hints(sheet_data),
+                }
+                export_data['sheets'].append(sheet_info)
+
+        index_path = os.path.join(output_dir, 'index.json')
+        with open(index_path, 'wb') as f:
+            f.write(_dumps_bytes(export_data))
+
+        prompt = self._generate_ai_prompt_template(export_data)
+        prompt_path = os.path.join(output_dir, 'conversion_prompt.md')
+        with open(prompt_path, 'w', encoding='utf-8') as f:
+            f.write(prompt)
+
+        guide = self._generate_conversion_guide(export_data)
+        guide_path = os.path.join(output_dir, 'conversion_guide.md')
+        with open(guide_path, 'w', encoding='utf-8') as f:
+            f.write(guide)
+
+        return export_data
+
+    def _generate_markdown_hints(self, sheet_data):
+        """Markdown変換のためのヒントを生成する"""
+        # 同じ辞書チェーンを何度も引かないようローカルに束ねる
+        ss = sheet_data['semantic_structure']
+        tables = sheet_data['tables']
+        formatting_hints = sheet_data['formatting_hints']
+
+        # 件数は使わずゼロ/非ゼロだけ見るので、1回の走査で両フラグを
+        # 立てて、両方見つかった時点で打ち切る(空リストならループは
+        # 素通りするため、事前の空チェックは不要)
+        has_bold = has_heading = False
+        for h in formatting_hints:
+            if not has_bold and h.get('bold'):
+                has_bold = True
+            if not has_heading and h.get('possible_heading'):
+                has_heading = True
+            if has_bold and has_heading:
+                break
+
+        # ヒントの中身はこの構造指紋だけで決まる。組み立てはキャッシュし、
+        # 呼び出し側が書き換えても安全なようにコピーを返す
+        hints = _build_markdown_hints(
+            len(tables), bool(ss['sections']),
+            tuple(t.get('table_id') for t in tables),
+            tuple(t['has_header'] for t in tables),
+            tuple(t['alignment'] for t in tables),
+            has_bold, has_heading)
+        return copy.deepcopy(hints)
+
+    def _generate_ai_prompt_template(self, integrated_data):
+        """AIに渡すMarkdown変換プロンプトを生成する"""
+        # StringIOは単一バッファに追記するため、シート数分の断片を
+        # リストに貯めてからjoinするより割り当てが少ない
+        buf = io.StringIO()
+        buf.write(_PROMPT_HEADER.format(
+            source_file=integrated_data['source_file'],
+            sheet_count=integrated_data['sheet_count']))
+        for sheet_info in integrated_data['sheets']:
+            sheet_data = sheet_info['structure']
+            ss = sheet_data['semantic_structure']
+            mh = sheet_info['markdown_hints']
+            # format_mapはキーワード引数の詰め替えなしに辞書を直接参照する
+            buf.write(_SHEET_TMPL.format_map({
+                'name': sheet_info['name'],
+                'document_type': ss['document_type'],
+                'table_count': len(sheet_data['tables']),
+                'section_count': len(ss['sections']),
+                'suggested_structure': mh['suggested_structure']}))
+        buf.write(_PROMPT_FOOTER)
+        return buf.getvalue()
+
+    def _generate_conversion_guide(self, integrated_data):
+        """変換作業ガイド(補足説明)を生成する"""
+        guide_parts = ["# 変換ガイド\n\n",
+                       f"対象ファイル: {integrated_data['source_file']}\n\n"]
+        guide_parts.extend(
+            f"- {sheet_info['name']}: {len(sheet_info['pages'])} ページ\n"
+            for sheet_info in integrated_data['sheets'])
+        guide_parts.append(_GUIDE_TAIL)
+        return ''.join(guide_parts)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("使い方: python excel_reader_visualizer.py <Excelファイル> [出力ディレクトリ]")
+        return
+
+    file_path = sys.argv[1]
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else 'ai_input'
+
+    if not os.path.exists(file_path):
+        print(f"エラー: ファイルが見つかりません: {file_path}")
+        return
+
+    try:
+        print(f"読み込み中: {file_path}")
+        preprocessor = ExcelToMarkdownPreprocessor(file_path, load_formatting=True)
+        export_data = preprocessor.export_for_ai_processing(output_dir)
+
+        # printを1行ずつ発行するとstdoutのロック・エンコード・フラッシュが
+        # 行数分発生するため、サマリーは組み立ててから一括で書き出す
+        out = []
+        out.append("\n=== 処理結果サマリー ===")
+        out.append(f"ファイル: {export_data['source_file']}")
+        out.append(f"シート数: {export_data['sheet_count']}")
+        for sheet_info in export_data['sheets']:
+            sheet_data = sheet_info['structure']
+            out.append(f"\n[{sheet_info['name']}]")
+            # 正常系ではsheet_dataは必ずキーの揃ったdict。毎回の型チェックと
+            # キー存在確認はやめ、異常時だけ例外で報告するEAFPにする
+            try:
+                cells = sheet_data['cells']
+                tables = sheet_data['tables']
+                merged = sheet_data['merged']
+            except TypeError:
+                out.append(f"  データ形式が予期されるものと異なります: "
+                           f"{type(sheet_data)}")
+                continue
+            except KeyError as e:
+                out.append(f"  {e.args[0]}: データなし")
+                continue
+            out.append(f"  セル数: {len(cells)}")
+            out.append(f"  テーブル数: {len(tables)}")
+            out.append(f"  結合セル数: {len(merged)}")
+            out.append(f"  ページ数: {len(sheet_info['pages'])}")
+            if cells:
+                out.append("  サンプルデータ:")
+                # 先頭3件だけ見るのに全セルをリスト化しない
+                for coord, value in islice(cells.items(), 3):
+                    s = str(value)
+                    value_str = s[:30] + '...' if len(s) > 30 else s
+                    out.append(f"    {coord}: {value_str}")
+        out.append(f"\n出力先: {output_dir}/")
+        sys.stdout.write("\n".join(out) + "\n")
+        preprocessor.close()
+    except Exception as e:
+        print(f"エラー: ファイルの処理に失敗しました: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == '__main__':
+    main()